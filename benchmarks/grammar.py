@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""Benchmark the pyrd grammar compiler on large synthetic grammars.
+
+usage: python benchmarks/grammar.py [rules] [statements]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from pyrd import pyrd_grammar
+
+def synthetic_grammar(rules, statements):
+    """Build a grammar with `rules` chained production rules, each with a
+    right-recursive alternative whose action runs `statements` statements"""
+    body = ''.join('x = {{"k{}": [{{}}]}}; '.format(i)
+                   for i in range(statements))
+    lines = []
+    for i in range(rules - 1):
+        lines.append('r{0} :: r{1} "," r{0} {{{2}return r{0}}}\n'
+                     '    | r{1} /[a-z]+/ {{return [r{1}, parsed[1]]}};'
+                     .format(i, i + 1, body))
+    lines.append('r{} :: /[0-9]+/ {{return int(parsed[0])}};'
+                 .format(rules - 1))
+    return '\n'.join(lines) + '\n%%\n'
+
+def bench(rules, statements):
+    grammar = synthetic_grammar(rules, statements)
+    start = time.perf_counter()
+    parsed = pyrd_grammar.Grammar().parse(grammar)
+    parse_time = time.perf_counter() - start
+    if not parsed:
+        print("Error:", parsed.err(grammar))
+        exit(1)
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        parsed.result.gen_code(os.path.join(tmp, 'out.py'))
+        gen_time = time.perf_counter() - start
+    print("{:>6} rules {:>4} statements {:>8.1f} KB: parse {:.3f}s, "
+          "generate {:.3f}s".format(rules, statements, len(grammar) / 1024,
+                                    parse_time, gen_time))
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        bench(int(sys.argv[1]), int(sys.argv[2]) if len(sys.argv) > 2 else 1)
+    else:
+        for rules, statements in [(1000, 1), (10000, 1), (1000, 100)]:
+            bench(rules, statements)
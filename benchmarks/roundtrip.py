@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""Check that the hand-written grammar parser and the parser generated from
+examples/grammar.grammar compile every example grammar to the same code,
+and that the compiled examples give the expected results.
+
+usage: python benchmarks/roundtrip.py
+"""
+import glob
+import importlib.util
+import logging
+import os
+import sys
+import tempfile
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, root)
+from pyrd import pyrd_grammar
+
+# grammar: [(parser class, input, expected result)]
+EXPECTED = {
+    'calc.grammar': [('Expr', '1 + 2 * 3 - 4', 3)],
+    'json.grammar': [('Json', '{"a": [1, "x", true, null]}',
+                      {'a': [1.0, 'x', True, None]})],
+    'recursive.grammar': [('X', 'a b 1 c d 2 e', ('a', 1, ('c', 2, 'e'))),
+                          ('Neg', 'neg 3 neg 4 5', 4)],
+    'tree.grammar': [('Expr', '1+2-3', (1, '+', (2, '-', 3)))],
+}
+
+def compile_grammar(grammar_parser, path, out):
+    with open(path) as gramf:
+        to_parse = gramf.read()
+    parsed = grammar_parser.parse(to_parse)
+    if not parsed:
+        print("Error in {}:".format(path), parsed.err(to_parse))
+        exit(1)
+    parsed.result.gen_code(out)
+    with open(out) as outpy:
+        return outpy.read()
+
+def load(name, path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def roundtrip():
+    grammars = sorted(glob.glob(os.path.join(root, 'examples', '*.grammar')))
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        self_hosted = os.path.join(tmp, 'grammar_parser.py')
+        compile_grammar(pyrd_grammar.Grammar(),
+                        os.path.join(root, 'examples', 'grammar.grammar'),
+                        self_hosted)
+        self_hosted = load('grammar_parser', self_hosted)
+        for path in grammars:
+            out = os.path.join(tmp, 'out.py')
+            expected = compile_grammar(pyrd_grammar.Grammar(), path, out)
+            actual = compile_grammar(self_hosted.Grammar(), path, out)
+            status = 'ok' if expected == actual else 'MISMATCH'
+            failed = failed or expected != actual
+            name = os.path.basename(path)
+            for class_, to_parse, result in EXPECTED.get(name, []):
+                parser = getattr(load(name[:-len('.grammar')], out), class_)
+                try:
+                    parsed = parser().parse(to_parse).result
+                except Exception as e:
+                    parsed = e
+                if parsed != result:
+                    status = 'WRONG RESULT {!r}'.format(parsed)
+                    failed = True
+            print("{:<8} {}".format(status, os.path.relpath(path, root)))
+    return not failed
+
+if __name__ == '__main__':
+    logging.getLogger().setLevel(logging.ERROR)
+    if not roundtrip():
+        exit(1)
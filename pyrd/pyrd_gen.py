@@ -4,6 +4,7 @@ from .templates import *
 import sys
 import re
 import logging
+import textwrap
 
 def id2class(id_):
     return ''.join([id_[0].upper(),id_[1:]])
@@ -31,7 +32,7 @@ class LexResult():
 
     def gen_handler(self):
         if self.index == 0:
-            return "{} = parsed_choice.choice[{{}}]".format(self.choice)
+            return "{} = parsed[{{}}]".format(self.choice)
         return None
 
     def check_left_recursion(self,id_):
@@ -59,28 +60,44 @@ class SeqResult():
             parsers = '({}).rr()'.format(parsers)
         return parsers
 
-    def gen_rr(self,idx):
-        if not self.right_recursive:
-            return ""
+    def gen_ids(self,lexers,skip_id=None):
+        """Assign each id's result to a local variable, one per line,
+        leaving out skip_id"""
         ids = []
-        for i,l in enumerate(self.lexers):
+        for i,l in enumerate(lexers):
+            if l.index == 0 and l.choice == skip_id:
+                continue
             line = l.gen_handler()
             if line:
                 ids.append(line.format(i))
-        ids = ('\n'+' '*16).join(ids)
-        return RR_CHOICE_TEMPLATE.format(IDS=ids,FUNCTION=self.function,IDX=idx)
+        return ('\n'+' '*8).join(ids)
+
+    def gen_function(self):
+        """Re-indent the action code to fit the body of a handler method,
+        whatever indentation its continuation lines were written with"""
+        if self.function is None:
+            return None
+        first, _, rest = self.function.partition('\n')
+        rest = textwrap.dedent(rest)
+        if not rest.strip():
+            return first
+        # a first line that opens a block is at the least indented level
+        # unless the block's body is
+        opens_block = first.rstrip().endswith(':')
+        body = rest.lstrip('\n')
+        indent = ' '*(12 if opens_block and body == body.lstrip() else 8)
+        return first + '\n' + textwrap.indent(rest,indent)
 
     def gen_handler(self,idx):
+        function = self.gen_function()
         if self.right_recursive:
-            function ="return self.handle_rr(parsed_choice)\n"
-            return CHOICE_TEMPLATE.format(IDS='',FUNCTION=function,IDX=idx)
-        ids = []
-        for i,l in enumerate(self.lexers):
-            line = l.gen_handler()
-            if line:
-                ids.append(line.format(i))
-        ids = ('\n'+' '*12).join(ids)
-        return CHOICE_TEMPLATE.format(IDS=ids,FUNCTION=self.function,IDX=idx)
+            # the recursive id is passed in by fold_rr rather than parsed
+            id_ = self.lexers[-1].choice
+            ids = self.gen_ids(self.lexers,skip_id=id_)
+            return RR_CHOICE_TEMPLATE.format(IDS=ids,
+                    FUNCTION=function,IDX=idx,ID=id_)
+        return CHOICE_TEMPLATE.format(IDS=self.gen_ids(self.lexers),
+                FUNCTION=function,IDX=idx)
 
     def check_left_recursion(self,id_):
         self.lexers[0].check_left_recursion(id_)
@@ -107,26 +124,19 @@ class RuleResult():
 
     def gen_handler(self):
         parsers = []
-        for i,sequence in enumerate(self.sequences): 
-            parsers.append(sequence.gen_handler(i))
-
-        return HANDLER_TEMPLATE.format(CODE=''.join(parsers))
-
-    def gen_rr(self):
         handlers = []
         for i,sequence in enumerate(self.sequences): 
-            handlers.append(sequence.gen_rr(i))
+            parsers.append(sequence.gen_handler(i))
+            handlers.append('handle_{},'.format(i))
 
-        if any(handlers):
-            return RIGHT_RECURSIVE_TEMPLATE.format(CODE=''.join(handlers))
-        return ""
+        return HANDLER_TEMPLATE.format(CODE=''.join(parsers),
+                HANDLERS=''.join(handlers))
 
     def gen_code(self):
         parser = self.gen_parser()
         handler = self.gen_handler()
-        handler_rr = self.gen_rr()
         code = CLASS_TEMPLATE.format(ID=id2class(self.id),
-                HANDLER=handler, HANDLER_RR=handler_rr, PARSER=parser)
+                HANDLER=handler, PARSER=parser)
         return code
 
     def check_left_recursion(self):
@@ -159,8 +169,7 @@ class GrammarResult():
         classes = [r.gen_code() for r in self.rules]
         with open(path,'w') as outpy:
             outpy.write(PREFIX)
-            for class_ in classes:
-                outpy.write(class_)
+            outpy.write(''.join(classes))
             outpy.write(self.suffix) 
 
     def optimize(self):
@@ -1,120 +1,177 @@
-"""Hand-written recursive descent parser for the pyrd grammar"""
+"""Hand-written recursive descent parser for the pyrd grammar
+
+The parsers in this module work on an offset into the grammar text rather
+than on the unparsed remainder, and parse repeated elements with loops
+rather than right recursion, so a grammar is parsed in linear time and
+constant stack depth regardless of how many rules it has.
+"""
 from .pyrd import *
 from .pyrd_gen import *
 import sys
 import re
 
-""" Parsers """
-
-class Grammar(Parser):
-    def parse(self,string):
-        parsed = (Rules() & Delim("%%") 
-                & PySuffix()).parse(string)
-        if parsed:
-            parsed.result = GrammarResult(parsed.result[0][::-1],
-                                          parsed.result[1])
-        return parsed
-
-class PySuffix(ParseRE):
-    regex = re.compile(r'(\n|[^\n])*')
+spaces_re = re.compile(r'\s*')
 
-class Rules(Parser):
-    def parse(self,string):
-        parsed = ( Rule() & Delim(";") & Rules()
-                 | Rule() & Delim(";")).parse(string)
-        if parsed:
-            if parsed.result.index == 0:
-                rule, rules = parsed.result.choice
-                rules.append(rule)
-                parsed.result = rules
-            else:
-                parsed.result = [parsed.result.choice[0]]
-        return parsed
-
-class Rule(Parser):
-    def parse(self, string):
-        parsed = (Id() & Delim("::") & Sequences()).parse(string)
-        if parsed:
-            parsed.result = RuleResult(parsed.result[0],parsed.result[1][::-1])
-        return parsed
-
-class Sequences(Parser):
-    def parse(self, string):
-        parsed = (Sequence() & Delim('|') & Sequences() 
-                 | Sequence()).parse(string)
-        if parsed:
-            if parsed.result.index == 0:
-                sequence, sequences = parsed.result.choice
-                sequences.append(sequence)
-                parsed.result = sequences
-            else:
-                parsed.result = [parsed.result.choice]
+def skip_spaces(string, pos):
+    return spaces_re.match(string, pos).end()
 
-        return parsed
+def scan_re(parser, string, pos):
+    """Match a ParseRE at pos, ignoring leading whitespace.
+    Return (result, end, error)"""
+    pos = skip_spaces(string, pos)
+    match = parser._regex.match(string, pos)
+    if match:
+        return match.group(0)[parser.group], match.end(), ""
+    return None, pos, parser.expected or "Expected match of /{}/".format(
+            parser._regex.pattern)
 
-class Sequence(Parser):
-    def parse(self, string):
-        parsed = (Lexers() & Function()
-                 | Lexers()).parse(string)
-        if parsed:
-            if parsed.result.index == 0:
-                lexers, function = parsed.result.choice
-                lexers = lexers[::-1]
-            else:
-                lexers = parsed.result.choice[::-1]
-                function = None
-            parsed.result = SeqResult(lexers,function)
-        return parsed
+def farthest(*failures):
+    """Pick the (result, end, error) failure that got farthest in the parse,
+    preferring the earliest given on a tie"""
+    return max(failures, key=lambda x: x[1])
 
-class Function(Parser):
-    def parse(self, string):
-        parsed = (Delim('{') & PyLit() & Delim('}')).parse(string)
-        if parsed:
-            parsed.result = parsed.result[0]
-        return parsed
+""" Parsers """
 
-class PyLit(Parser):
+class GrammarParser(Parser):
+    """Base class for parsers of the pyrd grammar. Subclasses implement
+    scan(string, pos), which returns (result, end, error)"""
     def parse(self, string):
-        parsed = (PyStr() & PyBrack() & PyLit()
-                  | PyStr()).parse(string)
-        if parsed:
-            if parsed.result.index == 0:
-                parsed.result = ''.join(parsed.result.choice.results)
-            else:
-                parsed.result = parsed.result.choice
-        return parsed
+        Parser.PARSES +=1
+        result, end, error = self.scan(string, 0)
+        if error:
+            return Parsed("", string[end:], error)
+        return Parsed(string[:end], string[end:], "", result)
+
+    def scan(self, string, pos):
+        return None, pos, ""
+
+class Grammar(GrammarParser):
+    def scan(self, string, pos):
+        rules_parser = Rules()
+        rules, pos, error = rules_parser.scan(string, pos)
+        if error:
+            return rules, pos, error
+        _, end, error = scan_re(grammar_delim, string, pos)
+        if error:
+            return farthest((None, end, error), rules_parser.last_error)
+        suffix, end, _ = scan_re(py_suffix, string, end)
+        return GrammarResult(rules, suffix), end, ""
 
+class PySuffix(ParseRE):
+    regex = re.compile(r'(\n|[^\n])*')
 
-class PyStr(ParseRE):
-    regex = re.compile(r'[^{}]*')
-
-class PyBrack(Parser):
-    """Support bracket characters inside python-literal expressions"""
-    def parse(self, string):
-        parsed = (Delim('{') & PyLit() & Delim('}')).parse(string)
-        if parsed:
-            parsed.result = '{{{}}}'.format(parsed.result[0])
-        return parsed
-
-class Lexers(Parser):
-    def parse(self,string):
-        parsed = (Lexer() & Lexers() | Lexer()).parse(string)
-        if parsed:
-            if parsed.result.index == 0:
-                lexer,lexers  = parsed.result.choice
-                lexers.append(lexer)
-                parsed.result = lexers
+class Rules(GrammarParser):
+    """Parse rules until one fails, keeping that failure in last_error in
+    case it explains what went wrong better than the caller's error"""
+    def scan(self, string, pos):
+        rules = []
+        rule_parser = Rule()
+        while True:
+            rule, end, error = rule_parser.scan(string, pos)
+            if not error:
+                _, end, error = scan_re(rule_delim, string, end)
+            if error:
+                self.last_error = (None, end, error)
+                break
+            rules.append(rule)
+            pos = end
+        if not rules:
+            return self.last_error
+        return rules, pos, ""
+
+class Rule(GrammarParser):
+    def scan(self, string, pos):
+        id_, pos, error = scan_re(id_parser, string, pos)
+        if not error:
+            _, pos, error = scan_re(id_delim, string, pos)
+        if not error:
+            sequences, pos, error = Sequences().scan(string, pos)
+        if error:
+            return None, pos, error
+        return RuleResult(id_, sequences), pos, ""
+
+class Sequences(GrammarParser):
+    def scan(self, string, pos):
+        sequence_parser = Sequence()
+        sequence, pos, error = sequence_parser.scan(string, pos)
+        if error:
+            return None, pos, error
+        sequences = [sequence]
+        while True:
+            # back up to before the "|" if no sequence follows it
+            _, end, error = scan_re(sequence_delim, string, pos)
+            if error:
+                break
+            sequence, end, error = sequence_parser.scan(string, end)
+            if error:
+                break
+            sequences.append(sequence)
+            pos = end
+        return sequences, pos, ""
+
+class Sequence(GrammarParser):
+    def scan(self, string, pos):
+        lexers, pos, error = Lexers().scan(string, pos)
+        if error:
+            return None, pos, error
+        function, end, error = Function().scan(string, pos)
+        if error:
+            function, end = None, pos
+        return SeqResult(lexers, function), end, ""
+
+class Function(GrammarParser):
+    def scan(self, string, pos):
+        _, pos, error = scan_re(open_bracket, string, pos)
+        if error:
+            return None, pos, error
+        pylit, pos, error = PyLit().scan(string, pos)
+        if error:
+            return None, pos, error
+        _, pos, error = scan_re(close_bracket, string, pos)
+        if error:
+            return None, pos, error
+        return pylit, pos, ""
+
+class PyLit(GrammarParser):
+    """Python code up to the first unbalanced closing bracket. Nested
+    brackets are kept as written"""
+    brackets = re.compile(r'[{}]')
+    def scan(self, string, pos):
+        start = pos
+        depth = 0
+        for bracket in self.brackets.finditer(string, pos):
+            if bracket.group(0) == '{':
+                depth += 1
+            elif depth:
+                depth -= 1
             else:
-                parsed.result = [parsed.result.choice]
-        return parsed
-
-class Lexer(Parser):
-    def parse(self,string):
-        parsed = SpacesAround(Id() | String() | Regex()).parse(string)
-        if parsed:
-            parsed.result = LexResult(parsed.result.results[0].index,
-                                      parsed.result.results[0].choice)
-        return parsed
+                return string[start:bracket.start()], bracket.start(), ""
+        return None, len(string), close_bracket.expected
+
+class Lexers(GrammarParser):
+    def scan(self, string, pos):
+        lexer_parser = Lexer()
+        lexer, pos, error = lexer_parser.scan(string, pos)
+        if error:
+            return None, pos, error
+        lexers = [lexer]
+        while True:
+            lexer, end, error = lexer_parser.scan(string, pos)
+            if error:
+                break
+            lexers.append(lexer)
+            pos = end
+        return lexers, pos, ""
+
+class Lexer(GrammarParser):
+    def scan(self, string, pos):
+        failures = []
+        for index, parser in enumerate(lexer_parsers):
+            result, end, error = scan_re(parser, string, pos)
+            if not error:
+                return LexResult(index, result), skip_spaces(string, end), ""
+            failures.append((None, end, error))
+        return farthest(*failures)
 
 class Regex(ParseRE):
     regex = re.compile(r"/(\\/|[^/])*/")
@@ -123,3 +180,13 @@ class Regex(ParseRE):
 class Id(ParseRE):
     regex = re.compile(r"[a-zA-Z_][a-zA-Z0-9_]*")
 
+""" Token parsers, built once and shared by every parse """
+py_suffix = PySuffix()
+id_parser = Id()
+lexer_parsers = [id_parser, String(), Regex()]
+grammar_delim = Delim("%%")
+rule_delim = Delim(";")
+id_delim = Delim("::")
+sequence_delim = Delim("|")
+open_bracket = Delim("{")
+close_bracket = Delim("}")
@@ -19,11 +19,21 @@ def standardize_result(result):
         result.choice = both
     return result
 
+def fold_rr(handler, rr):
+    """ Fold the unrolled cases of a right-recursive parse into its base case,
+    innermost case first. Each case gets the result so far appended in place,
+    so that it can be reached through parsed as well as by name
+    """
+    result = rr.base
+    for case in reversed(rr.unrolled.results):
+        case.results.append(result)
+        result = handler(case, result)
+    return result
+
 '''
 CLASS_TEMPLATE = """\
 class {ID}(Parser):
 {HANDLER}
-{HANDLER_RR}
 {PARSER}
 """
 
@@ -37,30 +47,25 @@ PARSE_TEMPLATE = """\
 """
 
 HANDLER_TEMPLATE = """\
+{CODE}\
+    handlers = ({HANDLERS})
+
     def handle_parsed(self,parsed_choice):
-        parsed = parsed_choice.choice
-{CODE}
+        return self.handlers[parsed_choice.index](self,parsed_choice.choice)
 """
 
-RIGHT_RECURSIVE_TEMPLATE = """\
-    def handle_rr(self,parsed_choice):
-{CODE}
-"""
 CHOICE_TEMPLATE = """\
-        if parsed_choice.index == {IDX}:
-            {IDS}
-            {FUNCTION}
+    def handle_{IDX}(self,parsed):
+        {IDS}
+        {FUNCTION}
+
 """
 RR_CHOICE_TEMPLATE = """\
-        if parsed_choice.index == {IDX}:
-            def _helper(parsed_choice):
-                parsed = parsed_choice.choice
-                {IDS}
-                {FUNCTION}
-            base = parsed_choice.choice[0].base
-            for case in parsed_choice.choice[0].unrolled[::-1]:
-                case_choice = ParseObjectEither(case,0)
-                case_choice.choice.append(base)
-                base = _helper(case_choice)
-            return base
+    def handle_rr_{IDX}(self,parsed,{ID}):
+        {IDS}
+        {FUNCTION}
+
+    def handle_{IDX}(self,parsed):
+        return fold_rr(self.handle_rr_{IDX},parsed[0])
+
 """